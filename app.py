@@ -10,8 +10,15 @@
 from shiny import App, reactive, render, ui
 from shinywidgets import output_widget, render_widget
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
+import numpy as np
+from pathlib import Path
+import functools
+import hashlib
+import os
+import pickle
 import re
+import tempfile
 
 # ---------------------- Config ----------------------
 INTENT_LEVELS = [
@@ -22,37 +29,269 @@ INTENT_LEVELS = [
     "Definitely not going",
 ]
 TENURE_LEVELS = ["0 to 5 years", "6 to 10 years", "11 to 15 years", "16 or more years"]
-
-# ---------------------- Data load ----------------------
-# Place your simplified dataset as "trb_simplified.csv" in the same folder as this app.py
-BASE_DF = pd.read_csv("trb_simplified.csv", dtype=str).fillna("")
-BASE_DF.columns = [c.strip() for c in BASE_DF.columns]
-# Types
-BASE_DF["Last5Years"] = pd.to_numeric(BASE_DF["Last5Years"], errors="coerce")
-BASE_DF["AttendTRBAM2026"] = pd.Categorical(BASE_DF["AttendTRBAM2026"], categories=INTENT_LEVELS)
-BASE_DF["HowLong"] = pd.Categorical(BASE_DF["HowLong"], categories=TENURE_LEVELS, ordered=True)
-
-# Strip spaces, replace inconsistent variants with "Consulting"
-BASE_DF["Organization"] = BASE_DF["Organization"].str.strip().replace({
-    "Consultant": "Consulting",
-    "consultant": "Consulting",
-    "CONSULTANT": "Consulting",
-    "software": "Software"
-})
+LAST5_LABELS = [f"{i} time{'' if i == 1 else 's'}" for i in range(0, 6)] + ["Unspecified"]
 
 # ---------------------- Helpers ----------------------
-def split_orgs(cell: str) -> list[str]:
+_ORG_SPLIT_RE = re.compile(r"\s*(,|/|;|\+| and )\s*")
+_SEP = {",", "/", ";", "+", " and "}
+
+# Far fewer unique Organization strings than rows, so memoize per cell value
+@functools.lru_cache(maxsize=4096)
+def split_orgs(cell: str) -> tuple[str, ...]:
     if not cell:
-        return []
-    parts = re.split(r"\s*(,|/|;|\+| and )\s*", str(cell))
-    return [p.strip() for p in parts if p and p not in {",", "/", ";", "+", " and "}]
+        return ()
+    parts = _ORG_SPLIT_RE.split(str(cell))
+    return tuple(p.strip() for p in parts if p and p not in _SEP)
 
 def _label_na(series: pd.Series, label="Unspecified") -> pd.Series:
+    # Categoricals stay categorical: add the label as a category instead of going through object
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.add_categories([label]).fillna(label)
     s = series.astype(object)
     return s.where(~pd.isna(s), other=label)
 
-# Precompute org choices from full dataset
-ORG_CHOICES = sorted({t for cell in BASE_DF["Organization"].astype(str) for t in split_orgs(cell)})
+# ---------------------- Data load ----------------------
+# Place your simplified dataset as "trb_simplified.csv" in the same folder as this app.py
+CSV_PATH = Path("trb_simplified.csv")
+# Fully prepared data (BASE_DF + lookup arrays) is pickled to a private per-user cache
+# dir (so it never ends up in a deploy bundle), keyed by a hash of the CSV bytes, this
+# module's source and the pandas/numpy versions. Any change to the data or prep code misses.
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "trb_survey"
+
+def _is_private(path: Path) -> bool:
+    # Only trust (unpickle from / write into) paths we own that nobody else can write to
+    st = path.stat()
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return False
+    return not st.st_mode & 0o022
+
+def _prepare_data(csv_path: Path) -> dict:
+    df = pd.read_csv(csv_path, dtype=str).fillna("")
+    df.columns = [c.strip() for c in df.columns]
+    # Types
+    # Non-integral or out-of-int8-range answers can't be a count of visits; treat them as missing
+    l5_num = pd.to_numeric(df["Last5Years"], errors="coerce")
+    l5_num = l5_num.where(l5_num.eq(l5_num.round()) & l5_num.between(-128, 127))
+    df["Last5Years"] = l5_num.astype("Int8")
+    df["AttendTRBAM2026"] = pd.Categorical(df["AttendTRBAM2026"], categories=INTENT_LEVELS)
+    df["HowLong"] = pd.Categorical(df["HowLong"], categories=TENURE_LEVELS, ordered=True)
+
+    # Last5Years pie labels ("0 times", "1 time", ..., "Unspecified"), built once rather than per render
+    l5 = (
+        df["Last5Years"].astype(object)
+        .where(df["Last5Years"].notna(), "Unspecified").to_numpy(dtype=str)
+    )
+    df["_Last5Years_display"] = pd.Categorical(
+        np.where(l5 == "Unspecified", "Unspecified",
+                 np.where(l5 == "1", "1 time", np.char.add(l5, " times"))),
+        categories=LAST5_LABELS, ordered=True,
+    )
+
+    # Strip spaces, replace inconsistent variants with "Consulting".
+    # Cleaned on the unique strings (categories) only: org_cats holds the cleaned values
+    # and org_codes maps each row to one of them.
+    org = df["Organization"].astype("category")
+    aliases = {
+        "Consultant": "Consulting",
+        "consultant": "Consulting",
+        "CONSULTANT": "Consulting",
+        "software": "Software"
+    }
+    remap, org_cats = pd.factorize(org.cat.categories.str.strip().to_series().replace(aliases))
+    org_codes = remap[org.cat.codes.to_numpy()]
+
+    # Precompute org choices from full dataset (one row per (response, org) mention);
+    # each unique org string is split once and spread to rows by code
+    org_tokens = pd.Series([split_orgs(c) for c in org_cats], dtype=object).take(org_codes)
+    org_tokens.index = df.index
+    org_mentions = org_tokens.explode().dropna()
+    org_choices = sorted(org_mentions.unique())
+
+    # Observed Last5Years span, so a slider covering all of it can skip the range filter
+    l5_seen = df["Last5Years"].dropna()
+    l5_range = (int(l5_seen.min()), int(l5_seen.max())) if len(l5_seen) else (0, 0)
+
+    return {
+        # Only the columns the chart aggregations read; Last5Years and Organization live on
+        # in L5/L5_NA and ORG_ONEHOT below, and any extra CSV columns are dropped
+        "BASE_DF": df[["_Last5Years_display", "AttendTRBAM2026", "HowLong"]],
+        "ORG_CHOICES": org_choices,
+        # One boolean column per org (rows aligned with BASE_DF) so the org filter is a vectorized lookup
+        "ORG_ONEHOT": (
+            pd.get_dummies(org_mentions).groupby(level=0).any()
+            .reindex(index=df.index, columns=org_choices, fill_value=False)
+        ),
+        "EMPTY_ORG": org_tokens.map(len).eq(0).to_numpy(),
+        # Plain int8 Last5Years plus its missing mask for the range filter
+        "L5": df["Last5Years"].to_numpy(dtype=np.int8, na_value=-1),
+        "L5_NA": df["Last5Years"].isna().to_numpy(),
+        "L5_RANGE": l5_range,
+        # Categorical codes (int8, -1 = missing) for the intent/tenure filters
+        "INTENT_CODES": df["AttendTRBAM2026"].cat.codes.to_numpy(),
+        "TENURE_CODES": df["HowLong"].cat.codes.to_numpy(),
+    }
+
+def _cache_key(csv_path: Path) -> str:
+    h = hashlib.sha256()
+    h.update(csv_path.read_bytes())
+    h.update(Path(__file__).read_bytes())
+    h.update(f"{pd.__version__}|{np.__version__}".encode())
+    return h.hexdigest()
+
+def load_data(csv_path: Path = CSV_PATH, cache_dir: Path = CACHE_DIR) -> dict:
+    key = _cache_key(csv_path)
+    cache_path = cache_dir / f"trb_survey_{key[:16]}.pkl"
+    try:
+        cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        use_cache = _is_private(cache_dir)
+    except OSError:
+        use_cache = False  # e.g. no writable home on the deploy host; just skip caching
+    if not use_cache:
+        return _prepare_data(csv_path)
+
+    try:
+        if _is_private(cache_path):
+            with cache_path.open("rb") as f:
+                cached = pickle.load(f)
+            if cached.get("key") == key:
+                return cached["data"]
+    except Exception:
+        pass  # missing or unreadable cache: rebuild from the CSV
+
+    data = _prepare_data(csv_path)
+    # Write to a temp file and rename into place so concurrent workers never read a
+    # partially written cache
+    try:
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=cache_path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({"key": key, "data": data}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        return data
+    # Caches for older CSV/source versions will never be hit again
+    for old in cache_dir.glob("trb_survey_*.pkl"):
+        if old != cache_path:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+    return data
+
+_DATA = load_data()
+BASE_DF = _DATA["BASE_DF"]
+ORG_CHOICES = _DATA["ORG_CHOICES"]
+ORG_ONEHOT = _DATA["ORG_ONEHOT"]
+EMPTY_ORG = _DATA["EMPTY_ORG"]
+L5 = _DATA["L5"]
+L5_NA = _DATA["L5_NA"]
+L5_RANGE = _DATA["L5_RANGE"]
+INTENT_CODES = _DATA["INTENT_CODES"]
+TENURE_CODES = _DATA["TENURE_CODES"]
+
+# ---------------------- Filtering & aggregation ----------------------
+# Filter state is passed around as a hashable key:
+#   (yr0, yr1, frozenset(intents), frozenset(tenures), frozenset(orgs))
+# so the chart payloads below can be memoized across callbacks.
+# Selecting every intent/tenure level filters nothing, same as selecting none, so both
+# map to an empty set and share a cache entry.
+def filter_key(yr, intents, tens, orgs) -> tuple:
+    yr0, yr1 = yr
+    intents = frozenset(intents or [])
+    tens = frozenset(tens or [])
+    if intents >= set(INTENT_LEVELS):
+        intents = frozenset()
+    if tens >= set(TENURE_LEVELS):
+        tens = frozenset()
+    return (yr0, yr1, intents, tens, frozenset(orgs or []))
+
+def _filter_mask(key: tuple) -> np.ndarray:
+    yr0, yr1, intents, tens, sel_orgs = key
+    m = np.ones(len(BASE_DF), dtype=bool)
+
+    # Last5Years range (skipped when it spans every recorded value)
+    if yr0 > L5_RANGE[0] or yr1 < L5_RANGE[1]:
+        m &= L5_NA | ((L5 >= yr0) & (L5 <= yr1))
+
+    # Intention
+    if intents:
+        want = np.array([INTENT_LEVELS.index(x) for x in intents], dtype=np.int8)
+        m &= np.isin(INTENT_CODES, want) | (INTENT_CODES == -1)
+
+    # Tenure
+    if tens:
+        want = np.array([TENURE_LEVELS.index(x) for x in tens], dtype=np.int8)
+        m &= np.isin(TENURE_CODES, want) | (TENURE_CODES == -1)
+
+    # Organizations (any-of)
+    if sel_orgs:
+        m &= EMPTY_ORG | ORG_ONEHOT[list(sel_orgs)].to_numpy().any(axis=1)
+
+    return m
+
+def _agg_last5(m: np.ndarray) -> pd.DataFrame:
+    s = BASE_DF.loc[m, "_Last5Years_display"]
+    return s.value_counts(sort=False).rename_axis("label").reset_index(name="n")
+
+def _agg_intent(m: np.ndarray) -> pd.DataFrame:
+    s = BASE_DF.loc[m, "AttendTRBAM2026"]
+    # Categorical value_counts keeps category order, i.e. INTENT_LEVELS + ["Unspecified"]
+    return _label_na(s).value_counts(sort=False).rename_axis("label").reset_index(name="n")
+
+def _agg_orgs(m: np.ndarray) -> pd.DataFrame:
+    counts = ORG_ONEHOT[m].sum(axis=0)
+    return counts[counts > 0].sort_values().rename_axis("org").reset_index(name="n")
+
+def _agg_tenure(m: np.ndarray) -> pd.DataFrame:
+    s = BASE_DF.loc[m, "HowLong"]
+    return _label_na(s).value_counts(sort=False).rename_axis("label").reset_index(name="n")
+
+# Everything the charts need for one filter state, from a single mask
+def summarize(key: tuple) -> dict:
+    m = _filter_mask(key)
+    return {
+        "n": int(m.sum()),
+        "last5": _agg_last5(m),
+        "intent": _agg_intent(m),
+        "orgs": _agg_orgs(m),
+        "tenure": _agg_tenure(m),
+    }
+
+# ---------------------- Chart payloads ----------------------
+# Response count plus trace/title updates ready to apply to the chart widgets. This is
+# the one cache per filter key; the result is shared, so callers must not mutate it.
+def _pie_payload(df_count: pd.DataFrame, title: str) -> tuple[dict, str]:
+    d = df_count[df_count["n"] > 0]
+    if d.empty:
+        trace = dict(labels=[title], values=[1], hole=None, textposition=None, textinfo=None)
+        return trace, f"{title} (no data)"
+    trace = dict(
+        labels=d["label"].tolist(), values=d["n"].tolist(),
+        hole=0.3, textposition="inside", textinfo="percent+label",
+    )
+    return trace, title
+
+def _bar_payload(agg: pd.DataFrame) -> tuple[dict, str]:
+    trace = dict(x=agg["n"].tolist(), y=agg["org"].tolist())
+    return trace, "Organization (no data)" if agg.empty else "Organization (all)"
+
+@functools.lru_cache(maxsize=64)
+def chart_payloads(key: tuple) -> dict:
+    summary = summarize(key)
+    return {
+        "n": summary["n"],
+        "last5": _pie_payload(summary["last5"], "Times attended (last 5 years)"),
+        "intent": _pie_payload(summary["intent"], "Intention to attend"),
+        "orgs": _bar_payload(summary["orgs"]),
+        "tenure": _pie_payload(summary["tenure"], "Years in transportation"),
+    }
+
+# Warm the cache for the initial (unfiltered) view so the first page render is a lookup
+DEFAULT_KEY = filter_key((0, 5), INTENT_LEVELS, TENURE_LEVELS, [])
+chart_payloads(DEFAULT_KEY)
 
 # ----------------------------- UI ------------------------------------------
 app_ui = ui.page_fluid(
@@ -109,115 +348,75 @@ app_ui = ui.page_fluid(
 
 # --------------------------- Server logic -----------------------------------
 def server(input, output, session):
+    # No server-side throttling here: Shiny's slider binding already debounces drags
+    # (250 ms) on the client, and the selectize inputs only change on discrete picks.
+    @reactive.Calc
+    def current_key():
+        return filter_key(input.yr(), input.intent(), input.tenure(), input.orgs())
+
     @reactive.Calc
-    def df_filtered():
-        df = BASE_DF.copy()
-
-        # Last5Years range
-        yr0, yr1 = input.yr()
-        df = df[(df["Last5Years"].isna()) | ((df["Last5Years"] >= yr0) & (df["Last5Years"] <= yr1))]
-
-        # Intention
-        intents = set(input.intent())
-        if intents:
-            df = df[df["AttendTRBAM2026"].astype(str).isin(intents) | df["AttendTRBAM2026"].isna()]
-
-        # Tenure
-        tens = set(input.tenure())
-        if tens:
-            df = df[df["HowLong"].astype(str).isin(tens) | df["HowLong"].isna()]
-
-        # Organizations (any-of)
-        sel_orgs = set(input.orgs() or [])
-        if sel_orgs:
-            keep = []
-            for _, row in df.iterrows():
-                toks = set(split_orgs(row["Organization"]))
-                keep.append((not toks) or bool(toks & sel_orgs))
-            df = df[pd.Series(keep, index=df.index)]
-
-        return df.reset_index(drop=True)
+    def payloads():
+        return chart_payloads(current_key())
 
     # Header with response count
     @render.text
     def charts_header():
-        n = len(df_filtered())
+        n = payloads()["n"]
         return f"Charts (update with filters) — {n} response{'s' if n != 1 else ''}"
 
-    # ---------- Pie helper (no legend) ----------
-    def pie_from_counts(df_count: pd.DataFrame, label_col: str, value_col: str, title: str):
-        d = df_count[df_count[value_col] > 0].copy()
-        d[label_col] = d[label_col].astype(str).fillna("Unspecified")
-        if d.empty:
-            fig = px.pie(names=[title], values=[1], title=f"{title} (no data)")
-            fig.update_layout(showlegend=False)
-            return fig
-        fig = px.pie(d, names=label_col, values=value_col, hole=0.3, title=title)
-        fig.update_traces(textposition="inside", textinfo="percent+label")
-        fig.update_layout(showlegend=False)  # hide legend
+    # ---------- Chart helpers ----------
+    # Each figure is built once per session; the effects below only swap trace data
+    # in place, so filter changes don't rebuild or re-layout the whole figure.
+    def pie_widget() -> go.FigureWidget:
+        fig = go.FigureWidget(go.Pie())
+        fig.update_layout(showlegend=False, margin=dict(t=60))  # hide legend
         return fig
 
+    def apply_payload(fig: go.FigureWidget, payload: tuple[dict, str]):
+        trace, title = payload
+        with fig.batch_update():
+            fig.data[0].update(**trace)
+            fig.layout.title.text = title
+
     # Last5Years pie
     @render_widget
     def pie_last5():
-        d = df_filtered()
-        tmp = d.copy()
-        tmp["Last5Years"] = tmp["Last5Years"].astype("Int64").astype(object)
-        tmp["Last5Years"] = _label_na(tmp["Last5Years"], "Unspecified").astype(str)
-        order = [str(i) for i in range(0, 6)] + ["Unspecified"]
-        agg = tmp.groupby("Last5Years").size().rename("n").reset_index()
-        agg["Last5Years"] = pd.Categorical(agg["Last5Years"], categories=order, ordered=True)
-        agg = agg.sort_values("Last5Years").rename(columns={"Last5Years": "label"})
-
-        # Add " year(s)" suffix to labels, except Unspecified
-        agg["label"] = agg["label"].apply(
-            lambda x: f"{x} time{'s' if x not in ['1','Unspecified'] else ''}"
-        )
+        return pie_widget()
 
-        return pie_from_counts(agg, "label", "n", "Times attended (last 5 years)")
+    @reactive.Effect
+    def _update_pie_last5():
+        apply_payload(pie_last5.widget, payloads()["last5"])
 
     # Intention pie
     @render_widget
     def pie_intent():
-        d = df_filtered()
-        tmp = d.copy()
-        tmp["AttendTRBAM2026"] = _label_na(tmp["AttendTRBAM2026"], "Unspecified")
-        order = INTENT_LEVELS + ["Unspecified"]
-        agg = tmp.groupby("AttendTRBAM2026").size().rename("n").reset_index()
-        agg["AttendTRBAM2026"] = pd.Categorical(agg["AttendTRBAM2026"], categories=order, ordered=True)
-        agg = agg.sort_values("AttendTRBAM2026").rename(columns={"AttendTRBAM2026": "label"})
-        return pie_from_counts(agg, "label", "n", "Intention to attend")
+        return pie_widget()
+
+    @reactive.Effect
+    def _update_pie_intent():
+        apply_payload(pie_intent.widget, payloads()["intent"])
 
     # Organization bar (ALL orgs, sorted)
     @render_widget
     def bar_orgs():
-        d = df_filtered()
-        rows = []
-        for _, r in d.iterrows():
-            rows.extend(split_orgs(r["Organization"]))
-        if not rows:
-            return px.bar(title="Organization (no data)")
-        org = pd.Series(rows, name="org")
-        agg = org.value_counts().rename_axis("org").reset_index(name="n")
-        fig = px.bar(
-            agg.sort_values("n", ascending=True),
-            x="n", y="org", orientation="h",
-            labels={"n": "Mentions", "org": "Organization"},
-            title="Organization (all)"
+        fig = go.FigureWidget(go.Bar(orientation="h"))
+        fig.update_layout(
+            xaxis_title="Mentions", yaxis_title="Organization",
+            yaxis_categoryorder="total ascending", margin=dict(t=60),
         )
-        fig.update_layout(yaxis_categoryorder="total ascending")
         return fig
 
+    @reactive.Effect
+    def _update_bar_orgs():
+        apply_payload(bar_orgs.widget, payloads()["orgs"])
+
     # Tenure pie
     @render_widget
     def pie_tenure():
-        d = df_filtered()
-        tmp = d.copy()
-        tmp["HowLong"] = _label_na(tmp["HowLong"], "Unspecified")
-        order = TENURE_LEVELS + ["Unspecified"]
-        agg = tmp.groupby("HowLong").size().rename("n").reset_index()
-        agg["HowLong"] = pd.Categorical(agg["HowLong"], categories=order, ordered=True)
-        agg = agg.sort_values("HowLong").rename(columns={"HowLong": "label"})
-        return pie_from_counts(agg, "label", "n", "Years in transportation")
+        return pie_widget()
+
+    @reactive.Effect
+    def _update_pie_tenure():
+        apply_payload(pie_tenure.widget, payloads()["tenure"])
 
 app = App(app_ui, server)